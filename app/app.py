@@ -1,87 +1,205 @@
 import os
 import time
+import heapq
+import hashlib
+import json
+import queue
+import atexit
 import threading
 import logging
-from flask import Flask, render_template, jsonify
+from logging.handlers import QueueHandler, QueueListener
+from flask import Flask, Response, jsonify, request
+from werkzeug.middleware.profiler import ProfilerMiddleware
+from prometheus_client import Gauge
+from prometheus_flask_exporter import PrometheusMetrics
 import psutil
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, 
-                   format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure logging: records go through a queue and are written to the console
+# by a listener thread, so the scheduler never blocks on stdout. Messages use
+# %-style args so formatting is skipped for records below the level
+_log_queue = queue.SimpleQueue()
+_console_handler = logging.StreamHandler()
+_console_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+_log_listener = QueueListener(_log_queue, _console_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+_queue_handler = QueueHandler(_log_queue)
+# Only merge args into the message here; the console handler adds the prefix
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+logging.basicConfig(level=logging.INFO, handlers=[_queue_handler])
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+# Request count/duration histograms per endpoint, exposed on /metrics
+metrics = PrometheusMetrics(app, path='/metrics')
+
 # Global variables to store memory data and settings
-memory_data = []
+memory_data = bytearray()  # Single buffer grown in place, len() is O(1)
 memory_increment_mb = int(os.environ.get('MEMORY_INCREMENT_MB', 10))  # Default to 10MB/sec
 should_run = True
+_process = psutil.Process(os.getpid())
+# Total RAM is constant for the container's lifetime, compute it once
+system_memory_total_gb = psutil.virtual_memory().total / (1024 * 1024 * 1024)
+
+# Keep /proc/self/statm open and pread() it for RSS instead of having psutil
+# open and parse /proc/self/status every sample; the fd is bound to this
+# process. Falls back to psutil where procfs isn't available (local dev)
+try:
+    _statm_fd = os.open('/proc/self/statm', os.O_RDONLY)
+    _page_size = os.sysconf('SC_PAGE_SIZE')
+except (OSError, AttributeError, ValueError):
+    _statm_fd = None
+
+def rss_bytes():
+    if _statm_fd is None:
+        return _process.memory_info().rss
+    # statm is "size resident shared ..." counted in pages
+    return int(os.pread(_statm_fd, 128, 0).split(b' ', 2)[1]) * _page_size
+
+# Target vs actual memory for dashboards, read at scrape time
+Gauge('memory_increment_mb', 'Configured memory increment in MB per second').set(memory_increment_mb)
+Gauge('memory_allocated_bytes', 'Bytes currently held in the memory buffer').set_function(lambda: len(memory_data))
+
+# Build the /status JSON body; done once per monitor tick, not per request
+def encode_status(current_memory, system_memory_percent, system_memory_available_gb, current_cpu):
+    return json.dumps({
+        'current_memory': current_memory,
+        'current_memory_gb': current_memory / 1024,
+        'system_memory_percent': system_memory_percent,
+        'system_memory_available_gb': system_memory_available_gb,
+        'system_memory_total_gb': system_memory_total_gb,
+        'current_cpu': current_cpu,
+        'system_cpu': current_cpu,
+        'memory_increment_mb': memory_increment_mb
+    }).encode('utf-8')
+
+# Encoded /status body refreshed once per second by resource_monitor_tick,
+# so /status never has to block on psutil sampling or encode JSON
+_status_body = encode_status(0.0, 0.0, 0.0, 0.0)
+
+# Increase memory usage by memory_increment_mb; returns seconds until the next run
+def memory_increment_tick():
+    global memory_data, memory_increment_mb
+    
+    try:
+        # Create a chunk of exactly memory_increment_mb megabytes
+        chunk_size = memory_increment_mb * 1024 * 1024
+        # Grow the buffer in place (realloc) instead of keeping a list of chunks;
+        # the zero source is calloc-backed, the copy commits the new pages
+        memory_data.extend(bytes(chunk_size))
+        
+        # Log current memory usage
+        current_usage = len(memory_data) / (1024 * 1024)
+        logger.info("Memory increased by %dMB. Total usage: %.2fMB", memory_increment_mb, current_usage)
+        
+        # Run again in exactly 1 second
+        return 1
+        
+    except MemoryError:
+        logger.error("Memory allocation error - reached system limit")
+        return 2
+    except Exception as e:
+        logger.error("Error in memory increment tick: %s", e)
+        return 1
 
-# Function to increase memory usage by a specific amount every second
-def memory_increment_thread():
-    global memory_data, should_run, memory_increment_mb
+# Refresh resource stats served by /status; returns seconds until the next run
+def resource_monitor_tick():
+    global _status_body
     
-    logger.info(f"Memory increment thread started with {memory_increment_mb}MB per second")
+    try:
+        system_memory = psutil.virtual_memory()
+        _status_body = encode_status(
+            rss_bytes() / (1024 * 1024),
+            system_memory.percent,
+            system_memory.available / (1024 * 1024 * 1024),
+            # CPU usage since the previous sample, i.e. over the last second
+            psutil.cpu_percent(interval=None)
+        )
+    except Exception as e:
+        logger.error("Error in resource monitor tick: %s", e)
+    
+    return 1
+
+# Single background thread running all periodic ticks from a deadline heap
+def scheduler_loop():
+    global should_run
+    
+    logger.info("Scheduler started, memory increment is %dMB per second", memory_increment_mb)
+    
+    # Prime cpu_percent so each non-blocking sample covers the time since the last tick
+    psutil.cpu_percent(interval=None)
+    
+    # Entries are (deadline, order, tick); order breaks ties without comparing functions
+    now = time.monotonic()
+    schedule = [(now, 0, memory_increment_tick), (now, 1, resource_monitor_tick)]
+    heapq.heapify(schedule)
     
     while should_run:
-        try:
-            # Create a chunk of exactly memory_increment_mb megabytes
-            chunk_size = memory_increment_mb * 1024 * 1024
-            memory_data.append('X' * chunk_size)
-            
-            # Log current memory usage
-            current_usage = sum(len(d) for d in memory_data) / (1024 * 1024)
-            logger.info(f"Memory increased by {memory_increment_mb}MB. Total usage: {current_usage:.2f}MB")
-            
-            # Sleep for exactly 1 second
-            time.sleep(1)
-            
-        except MemoryError:
-            logger.error("Memory allocation error - reached system limit")
-            time.sleep(2)
-        except Exception as e:
-            logger.error(f"Error in memory increment thread: {str(e)}")
-            time.sleep(1)
+        deadline, order, tick = heapq.heappop(schedule)
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        
+        interval = tick()
+        # Keep a fixed cadence, but don't burst to catch up after a slow tick
+        next_deadline = max(deadline + interval, time.monotonic())
+        heapq.heappush(schedule, (next_deadline, order, tick))
+
+# The page only depends on memory_increment_mb, which is fixed at startup,
+# so render it once and serve the cached bytes with an ETag
+_index_page = None
 
 @app.route('/')
 def index():
-    return render_template('index.html', memory_increment_mb=memory_increment_mb)
+    global _index_page
+    
+    if _index_page is None:
+        # Render the compiled template directly; the page needs no context processors
+        template = app.jinja_env.get_template('index.html')
+        body = template.render(memory_increment_mb=memory_increment_mb).encode('utf-8')
+        _index_page = (body, hashlib.sha1(body).hexdigest())
+    
+    body, etag = _index_page
+    response = Response(body, mimetype='text/html')
+    response.set_etag(etag)
+    # Answers 304 Not Modified when If-None-Match matches
+    return response.make_conditional(request)
 
 @app.route('/status')
 def status():
-    try:
-        # Get current process resource info
-        process = psutil.Process(os.getpid())
-        current_memory = process.memory_info().rss / (1024 * 1024)
-        current_cpu = psutil.cpu_percent(interval=0.1)
-        
-        # System resource info
-        system_memory = psutil.virtual_memory()
-        system_cpu = psutil.cpu_percent(interval=None)
-        
-        return jsonify({
-            'current_memory': current_memory,
-            'current_memory_gb': current_memory / 1024,
-            'system_memory_percent': system_memory.percent,
-            'system_memory_available_gb': system_memory.available / (1024 * 1024 * 1024),
-            'system_memory_total_gb': system_memory.total / (1024 * 1024 * 1024),
-            'current_cpu': current_cpu,
-            'system_cpu': system_cpu,
-            'memory_increment_mb': memory_increment_mb
-        })
-    except Exception as e:
-        logger.error(f"Error in status: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+    # The monitor tick swaps in a new pre-encoded body atomically
+    return Response(_status_body, mimetype='application/json')
 
 @app.route('/healthz')
 def health_check():
     # Simple health check for Kubernetes
     return jsonify({'status': 'ok'})
 
-# Start memory increment thread when app starts
-memory_thread = threading.Thread(target=memory_increment_thread)
-memory_thread.daemon = True
-memory_thread.start()
+# Per-request cProfile output to stderr when PROFILE is set
+if os.environ.get('PROFILE'):
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, restrictions=[20], sort_by=('cumulative',))
+
+# Kubernetes probes hit /healthz every few seconds; answer GETs with a
+# pre-encoded body before Flask sets up routing and a request context
+_HEALTHZ_BODY = b'{"status":"ok"}'
+_HEALTHZ_HEADERS = [('Content-Type', 'application/json'),
+                    ('Content-Length', str(len(_HEALTHZ_BODY)))]
+_flask_wsgi_app = app.wsgi_app
+
+def healthz_wsgi_app(environ, start_response):
+    if environ.get('PATH_INFO') == '/healthz' and environ.get('REQUEST_METHOD') == 'GET':
+        start_response('200 OK', list(_HEALTHZ_HEADERS))
+        return [_HEALTHZ_BODY]
+    return _flask_wsgi_app(environ, start_response)
+
+app.wsgi_app = healthz_wsgi_app
+
+# Start the background scheduler thread when app starts
+scheduler_thread = threading.Thread(target=scheduler_loop)
+scheduler_thread.daemon = True
+scheduler_thread.start()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=False) 
\ No newline at end of file
@@ -1,16 +1,118 @@
 #!/usr/bin/env python3
 import os
-import re
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import time
 import urllib3
 import json
+import threading
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Disable InsecureRequestWarning when verify=False
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Unit conversion factors, applied by multiplication
+_BYTES_TO_MIB = 1.0 / (1024.0 * 1024.0)
+_KI_TO_MIB = 1.0 / 1024.0
+_GI_TO_MIB = 1024.0
+_NANO = 1e-9
+_MICRO = 1e-6
+_MILLI = 1e-3
+
+# Metrics Server quantity suffix -> factor to cores / MiB
+_CPU_SUFFIXES = {"n": _NANO, "u": _MICRO, "m": _MILLI}
+_MEMORY_SUFFIXES_2 = {"Ki": _KI_TO_MIB, "Mi": 1.0, "Gi": _GI_TO_MIB}
+_MEMORY_SUFFIXES_1 = {"K": _KI_TO_MIB, "k": _KI_TO_MIB, "M": 1.0, "G": _GI_TO_MIB}
+
+# Kube State Metrics families read by KubeStateMetricsClient.parse_metrics
+_KSM_PREFIXES = ('kube_pod_container_resource_requests{', 'kube_pod_container_resource_limits{')
+_KSM_KIND_OFFSET = len('kube_pod_container_resource_')
+# Bytes read per chunk when streaming the Kube State Metrics payload
+_KSM_CHUNK_SIZE = 64 * 1024
+
+# (family kind, resource label) -> (result field, scale from KSM units: cores / bytes -> MiB)
+_KSM_FIELDS = {
+    ('requests', 'cpu'): ('requests_cpu_cores', 1.0),
+    ('requests', 'memory'): ('requests_mem_mib', _BYTES_TO_MIB),
+    ('limits', 'cpu'): ('limits_cpu_cores', 1.0),
+    ('limits', 'memory'): ('limits_mem_mib', _BYTES_TO_MIB)
+}
+
+# Strategic merge patch with new memory resources plus the last-update annotation;
+# filled in with (timestamp, JSON-encoded container name, request, limit)
+_PATCH_HEADERS = {"Content-Type": "application/strategic-merge-patch+json"}
+_PATCH_BODY_TEMPLATE = (
+    '{"metadata":{"annotations":{"resource-manager/last-update":"%s"}},'
+    '"spec":{"containers":[{"name":%s,"resources":'
+    '{"requests":{"memory":"%s"},"limits":{"memory":"%s"}}}]}}'
+)
+
+# Results of ResourceManager._scaling_direction
+_NO_SCALE = 0
+_SCALE_UP = 1
+_SCALE_DOWN = -1
+
+# Format of the resource-manager/last-update annotation (UTC)
+_TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _parse_timestamp(value):
+    """
+    Parses a _TIMESTAMP_FORMAT timestamp by slicing its fixed positions,
+    falling back to strptime for anything else. Raises ValueError if invalid
+    """
+    if (len(value) == 20 and value[4] == value[7] == '-' and value[10] == 'T'
+            and value[13] == value[16] == ':' and value[19] == 'Z'):
+        try:
+            return datetime(int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                            int(value[11:13]), int(value[14:16]), int(value[17:19]))
+        except ValueError:
+            pass
+    return datetime.strptime(value, _TIMESTAMP_FORMAT)
+
+
+def _scale_workers():
+    """
+    Number of pods evaluated and scaled in parallel (SCALE_WORKERS); also sizes the HTTP pools
+    """
+    return max(int(os.environ.get('SCALE_WORKERS', '8')), 1)
+
+
+class ContainerResources:
+    """Requests/limits of a container, as reported by Kube State Metrics"""
+    
+    __slots__ = ('requests_cpu_cores', 'requests_mem_mib', 'limits_cpu_cores', 'limits_mem_mib')
+    
+    def __init__(self):
+        self.requests_cpu_cores = 0.0
+        self.requests_mem_mib = 0.0
+        self.limits_cpu_cores = 0.0
+        self.limits_mem_mib = 0.0
+
+
+# Used for containers without Kube State Metrics data; never modified
+_NO_RESOURCES = ContainerResources()
+
+
+class ContainerMetrics:
+    """Current usage of a container together with its requests/limits"""
+    
+    __slots__ = ('cpu_usage', 'memory_usage', 'requests_cpu_cores', 'requests_mem_mib',
+                 'limits_cpu_cores', 'limits_mem_mib')
+    
+    def __init__(self, cpu_usage, memory_usage, resources):
+        self.cpu_usage = cpu_usage  # in cores
+        self.memory_usage = memory_usage  # in MiB
+        self.requests_cpu_cores = resources.requests_cpu_cores
+        self.requests_mem_mib = resources.requests_mem_mib
+        self.limits_cpu_cores = resources.limits_cpu_cores
+        self.limits_mem_mib = resources.limits_mem_mib
+
 
 class KubernetesClient:
     """Base class to handle Kubernetes API communication"""
@@ -18,9 +120,47 @@ class KubernetesClient:
     def __init__(self):
         self.verify_cert = os.environ.get("VERIFY_CERT", "true").lower() in ("true", "1", "t")
         
+        # One session per client keeps connections (and TLS sessions) alive between calls.
+        # Transient errors are retried for idempotent methods only, so PATCH is never replayed.
+        # Every scaling worker may hold a connection at once, so the pool is at least that big
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(32, _scale_workers()),
+            max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._auth_headers = None
+        
     def get_auth_headers(self):
         """
-        Returns authentication headers with Bearer Token.
+        Returns authentication headers with Bearer Token, loading them on first use
+        """
+        if self._auth_headers is None:
+            self._auth_headers = self._load_auth_headers()
+        return self._auth_headers
+    
+    def refresh_auth_headers(self):
+        """
+        Re-reads the token (e.g. after a 401, as ServiceAccount tokens are rotated)
+        and installs it on the session
+        """
+        self._auth_headers = self._load_auth_headers()
+        self.session.headers.update(self._auth_headers)
+    
+    def _refresh_auth_on_401(self, error):
+        """
+        Refreshes the auth headers if the failed request was rejected as unauthorized
+        """
+        response = getattr(error, 'response', None)
+        if response is not None and response.status_code == 401:
+            logging.warning("Request was unauthorized; reloading authentication token.")
+            self.refresh_auth_headers()
+    
+    def _load_auth_headers(self):
+        """
+        Reads authentication headers with Bearer Token.
         First tries to get token from K8S_BEARER_TOKEN environment variable.
         If not found, reads ServiceAccount token from /var/run/secrets/kubernetes.io/serviceaccount/token.
         """
@@ -45,6 +185,14 @@ class KubeStateMetricsClient(KubernetesClient):
         self.kube_state_url = os.environ.get('KUBE_STATE_METRICS_URL')
         if not self.kube_state_url:
             logging.warning("Environment variable 'KUBE_STATE_METRICS_URL' not set; cannot get requests/limits.")
+        
+        # Requests/limits change rarely, so a parsed scrape is reused for cache_ttl seconds
+        # (0 disables caching). The cache is dropped whenever we patch a pod ourselves
+        self.cache_ttl = int(os.environ.get('KSM_CACHE_TTL', '90'))
+        self._cache = None
+        self._cache_time = 0.0
+        # Whether the last fetch_metrics call returned the cached data
+        self.from_cache = False
     
     def fetch_metrics(self):
         """
@@ -53,109 +201,100 @@ class KubeStateMetricsClient(KubernetesClient):
         """
         if not self.kube_state_url:
             return {}
+        
+        if self._cache is not None and time.monotonic() - self._cache_time < self.cache_ttl:
+            self.from_cache = True
+            return self._cache
+        self.from_cache = False
 
         try:
             if logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug(f"Fetching data from Kube State Metrics")
                 
-            resp = requests.get(self.kube_state_url, verify=self.verify_cert)
-            resp.raise_for_status()
+            # Stream the payload and parse it line by line instead of holding the whole text.
+            # Large chunks keep the per-chunk overhead of iter_lines (default 512 bytes) low
+            with self.session.get(self.kube_state_url, stream=True, verify=self.verify_cert) as resp:
+                resp.raise_for_status()
+                if resp.encoding is None:
+                    resp.encoding = 'utf-8'
+                data = self.parse_metrics(
+                    resp.iter_lines(chunk_size=_KSM_CHUNK_SIZE, decode_unicode=True)
+                )
         except requests.RequestException as e:
             logging.error(f"Error requesting Kube State Metrics: {e}")
             return {}
-
-        data = self.parse_metrics(resp.text)
         
         if not data and logging.getLogger().isEnabledFor(logging.DEBUG):
             logging.debug("No resource data obtained from Kube State Metrics")
+        
+        self._cache = data
+        self._cache_time = time.monotonic()
             
         return data
     
-    def parse_metrics(self, text):
+    def invalidate(self):
         """
-        Parses text metrics in Prometheus format from Kube State Metrics
-        and returns a dictionary in the format:
+        Drops the cached metrics so the next fetch_metrics call scrapes again
+        """
+        self._cache = None
+    
+    def parse_metrics(self, lines):
+        """
+        Parses text metrics in Prometheus format from Kube State Metrics,
+        given as an iterable of lines, and returns a dictionary in the format:
         {
-          (namespace, pod, container): {
-             'requests_cpu_cores': float,
-             'requests_mem_mib': float,
-             'limits_cpu_cores': float,
-             'limits_mem_mib': float
-          },
+          (namespace, pod, container): ContainerResources,
           ...
         }
         """
-        # Regular expressions matching real metrics format
-        lim_cpu_pattern = re.compile(
-            r'^kube_pod_container_resource_limits\{.*?namespace="([^"]+)",pod="([^"]+)".*?container="([^"]+)".*?resource="cpu".*?\}\s+([\d\.eE\+\-]+)'
-        )
-        
-        lim_mem_pattern = re.compile(
-            r'^kube_pod_container_resource_limits\{.*?namespace="([^"]+)",pod="([^"]+)".*?container="([^"]+)".*?resource="memory".*?\}\s+([\d\.eE\+\-]+)'
-        )
-        
-        req_cpu_pattern = re.compile(
-            r'^kube_pod_container_resource_requests\{.*?namespace="([^"]+)",pod="([^"]+)".*?container="([^"]+)".*?resource="cpu".*?\}\s+([\d\.eE\+\-]+)'
-        )
-        
-        req_mem_pattern = re.compile(
-            r'^kube_pod_container_resource_requests\{.*?namespace="([^"]+)",pod="([^"]+)".*?container="([^"]+)".*?resource="memory".*?\}\s+([\d\.eE\+\-]+)'
-        )
-
         data = {}
 
-        def ensure_key(ns, pod, cont):
-            if (ns, pod, cont) not in data:
-                data[(ns, pod, cont)] = {
-                    'requests_cpu_cores': 0.0,
-                    'requests_mem_mib': 0.0,
-                    'limits_cpu_cores': 0.0,
-                    'limits_mem_mib': 0.0
-                }
-
-        for line in text.splitlines():
-            line = line.strip()
-            if line.startswith('#') or not line:  # Skip comments and empty lines
-                continue
-
-            # Find Request CPU
-            match = req_cpu_pattern.match(line)
-            if match:
-                namespace, pod, container, val = match.groups()
-                val = float(val)  # cores
-                ensure_key(namespace, pod, container)
-                data[(namespace, pod, container)]['requests_cpu_cores'] = val
-                continue
-
-            # Find Request Memory
-            match = req_mem_pattern.match(line)
-            if match:
-                namespace, pod, container, val = match.groups()
-                val = float(val) / (1024 * 1024)  # bytes -> MiB
-                ensure_key(namespace, pod, container)
-                data[(namespace, pod, container)]['requests_mem_mib'] = val
+        for line in lines:
+            # Only container requests/limits are needed. Test the prefix before anything else
+            # (no strip), so each of the many other lines costs a single startswith; this also
+            # skips comments and empty lines. The value parsing below tolerates trailing whitespace
+            if not line.startswith(_KSM_PREFIXES):
                 continue
 
-            # Find Limit CPU
-            match = lim_cpu_pattern.match(line)
-            if match:
-                namespace, pod, container, val = match.groups()
-                val = float(val)  # cores
-                ensure_key(namespace, pod, container)
-                data[(namespace, pod, container)]['limits_cpu_cores'] = val
+            # Locate the label block and the sample value with plain string operations
+            try:
+                lb = line.index('{')
+                rb = line.rindex('}')
+                labels = self.parse_labels(line[lb + 1:rb])
+                # "requests" or "limits", taken from the metric name
+                kind = line[_KSM_KIND_OFFSET:lb]
+                target = _KSM_FIELDS.get((kind, labels['resource']))
+                if target is None:
+                    continue
+                key = (labels['namespace'], labels['pod'], labels['container'])
+                val = float(line[rb + 1:].split(None, 1)[0])
+            except (ValueError, KeyError, IndexError):
                 continue
 
-            # Find Limit Memory
-            match = lim_mem_pattern.match(line)
-            if match:
-                namespace, pod, container, val = match.groups()
-                val = float(val) / (1024 * 1024)  # bytes -> MiB
-                ensure_key(namespace, pod, container)
-                data[(namespace, pod, container)]['limits_mem_mib'] = val
-                continue
+            field, scale = target
+            entry = data.get(key)
+            if entry is None:
+                entry = data[key] = ContainerResources()
+            setattr(entry, field, val * scale)
 
         return data
 
+    @staticmethod
+    def parse_labels(text):
+        """
+        Parses a Prometheus label block (the part between braces), e.g.
+        namespace="default",pod="web-1" -> {'namespace': 'default', 'pod': 'web-1'}
+        """
+        labels = {}
+        # Drop an optional trailing comma and the closing quote of the last value
+        text = text.rstrip(',')
+        if text.endswith('"'):
+            text = text[:-1]
+        for part in text.split('",'):
+            name, _, value = part.partition('="')
+            labels[name.strip()] = value
+        return labels
+
 
 class MetricsServerClient(KubernetesClient):
     """Client for fetching data from Metrics Server"""
@@ -167,6 +306,9 @@ class MetricsServerClient(KubernetesClient):
             logging.error("Environment variable 'METRICS_SERVER_URL' not set.")
         
         self.label_selector = os.environ.get('LABEL_SELECTOR')
+        
+        # Authenticate every request made through this client's session
+        self.session.headers.update(self.get_auth_headers())
     
     def fetch_metrics(self):
         """
@@ -182,17 +324,16 @@ class MetricsServerClient(KubernetesClient):
             params["labelSelector"] = self.label_selector
             if logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug(f"Using labelSelector: {self.label_selector}")
-        
-        headers = self.get_auth_headers()
 
         try:
             if logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug(f"Fetching metrics from Metrics Server")
                 
-            response = requests.get(url, params=params, headers=headers, verify=self.verify_cert)
+            response = self.session.get(url, params=params, verify=self.verify_cert)
             response.raise_for_status()
         except requests.RequestException as e:
             logging.error(f"Error fetching metrics from Metrics Server: {e}")
+            self._refresh_auth_on_401(e)
             return None
 
         return response.json()
@@ -201,14 +342,7 @@ class MetricsServerClient(KubernetesClient):
         """
         Parses pod metrics and returns dictionary with usage data
         {
-          (namespace, pod_name, container_name): {
-             'cpu_usage': float,  # in cores
-             'memory_usage': float,  # in MiB
-             'requests_cpu_cores': float,
-             'requests_mem_mib': float,
-             'limits_cpu_cores': float,
-             'limits_mem_mib': float
-          },
+          (namespace, pod_name, container_name): ContainerMetrics,
           ...
         }
         """
@@ -216,6 +350,11 @@ class MetricsServerClient(KubernetesClient):
         
         if not pod_metrics:
             return result
+        
+        # Pod names grouped for prefix search, built on the first lookup miss
+        pod_index = None
+        # Checked once per call instead of once per container
+        debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
             
         for pod in pod_metrics:
             metadata = pod.get("metadata", {})
@@ -226,106 +365,118 @@ class MetricsServerClient(KubernetesClient):
                 container_name = container.get("name", "unknown")
                 usage = container.get("usage", {})
 
-                # Convert CPU usage to cores
+                # Convert CPU usage to cores, dispatching on the unit suffix
                 cpu_usage = usage.get("cpu", "0")
-                cpu_value = 0.0
-                if cpu_usage.endswith("n"):
-                    cpu_value = int(cpu_usage[:-1]) / 1e9
-                elif cpu_usage.endswith("u"):
-                    cpu_value = int(cpu_usage[:-1]) / 1e6
-                elif cpu_usage.endswith("m"):
-                    cpu_value = float(cpu_usage[:-1]) / 1000.0
-                else:
-                    # If simply "1", "2", "1.5" etc.
-                    try:
+                try:
+                    scale = _CPU_SUFFIXES.get(cpu_usage[-1:])
+                    if scale is not None:
+                        cpu_value = float(cpu_usage[:-1]) * scale
+                    else:
+                        # If simply "1", "2", "1.5" etc.
                         cpu_value = float(cpu_usage)
-                    except ValueError:
-                        cpu_value = 0.0
+                except ValueError:
+                    cpu_value = 0.0
 
-                # Convert Memory usage to MiB
+                # Convert Memory usage to MiB: two-letter suffixes first, then one-letter
                 memory_usage = usage.get("memory", "0")
-                memory_value = 0.0
-                if memory_usage.endswith("Ki"):
-                    memory_value = float(memory_usage[:-2]) / 1024.0
-                elif memory_usage.endswith("Mi"):
-                    memory_value = float(memory_usage[:-2])
-                elif memory_usage.endswith("Gi"):
-                    memory_value = float(memory_usage[:-2]) * 1024.0
-                elif memory_usage.endswith("K") or memory_usage.endswith("k"):
-                    memory_value = float(memory_usage[:-1]) / 1024.0
-                elif memory_usage.endswith("M"):
-                    memory_value = float(memory_usage[:-1])
-                elif memory_usage.endswith("G"):
-                    memory_value = float(memory_usage[:-1]) * 1024.0
-                else:
-                    # Bytes (e.g. "123456")?
-                    try:
-                        memory_value = float(memory_usage) / (1024.0 * 1024.0)
-                    except ValueError:
-                        memory_value = 0.0
+                try:
+                    scale = _MEMORY_SUFFIXES_2.get(memory_usage[-2:])
+                    if scale is not None:
+                        memory_value = float(memory_usage[:-2]) * scale
+                    else:
+                        scale = _MEMORY_SUFFIXES_1.get(memory_usage[-1:])
+                        if scale is not None:
+                            memory_value = float(memory_usage[:-1]) * scale
+                        else:
+                            # Bytes (e.g. "123456")?
+                            memory_value = float(memory_usage) * _BYTES_TO_MIB
+                except ValueError:
+                    memory_value = 0.0
 
                 # Get requests/limits from Kube State Metrics
                 rsrc_key = (namespace, pod_name, container_name)
-                rsrc = state_data.get(rsrc_key, {})
+                rsrc = state_data.get(rsrc_key)
                 
-                # If not found, try different pod name matching patterns
-                if not rsrc:
-                    # Typical pattern for pod name: deployment-name-random-id-random-id
-                    # Try to find a match by partial name
-                    matched = False
-                    
-                    # 1. Check for exact match
-                    if rsrc_key in state_data:
-                        rsrc = state_data[rsrc_key]
-                        matched = True
-                        if logging.getLogger().isEnabledFor(logging.DEBUG):
-                            logging.debug(f"Found exact match for {rsrc_key}")
-                    
-                    # 2. Try to find by partial name (usually deployment-name-*)
-                    if not matched and '-' in pod_name:
-                        # Try to find by first N parts of name (removing replicaset and pod suffixes)
-                        parts = pod_name.split('-')
-                        for i in range(len(parts) - 1, 0, -1):
-                            # Create base name starting with 1, 2, ... parts
-                            base_name = '-'.join(parts[:i])
-                            if logging.getLogger().isEnabledFor(logging.DEBUG):
-                                logging.debug(f"Trying to find {namespace}/{base_name}-* for {pod_name}")
-                            
-                            # Find any key where namespace matches and pod name starts with base_name
-                            for key, value in state_data.items():
-                                if key[0] == namespace and key[2] == container_name and key[1].startswith(base_name):
-                                    rsrc = value
-                                    matched = True
-                                    if logging.getLogger().isEnabledFor(logging.DEBUG):
-                                        logging.debug(f"Found match {key} for {namespace}/{pod_name}/{container_name}")
-                                    break
-                            
-                            if matched:
-                                break
+                # If not found, try to find a match by partial name (usually deployment-name-*)
+                # Typical pattern for pod name: deployment-name-random-id-random-id
+                if rsrc is None and '-' in pod_name:
+                    if pod_index is None:
+                        pod_index = self.build_pod_index(state_data)
+                    rsrc = self.find_by_pod_prefix(
+                        pod_index, state_data, namespace, pod_name, container_name, debug_enabled
+                    )
                 
-                req_cpu = rsrc.get("requests_cpu_cores", 0.0)
-                req_mem = rsrc.get("requests_mem_mib", 0.0)
-                lim_cpu = rsrc.get("limits_cpu_cores", 0.0)
-                lim_mem = rsrc.get("limits_mem_mib", 0.0)
+                if rsrc is None:
+                    rsrc = _NO_RESOURCES
                 
-                result[rsrc_key] = {
-                    'cpu_usage': cpu_value,
-                    'memory_usage': memory_value,
-                    'requests_cpu_cores': req_cpu,
-                    'requests_mem_mib': req_mem,
-                    'limits_cpu_cores': lim_cpu,
-                    'limits_mem_mib': lim_mem
-                }
+                result[rsrc_key] = ContainerMetrics(cpu_value, memory_value, rsrc)
                 
-                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                if debug_enabled:
                     logging.debug(
                         f"Pod {namespace}/{pod_name}, Container {container_name} => "
                         f"Usage: CPU {cpu_value:.3f} cores / Mem {memory_value:.2f}Mi; "
-                        f"Request: CPU {req_cpu:.3f} / Mem {req_mem:.2f}Mi; "
-                        f"Limit: CPU {lim_cpu:.3f} / Mem {lim_mem:.2f}Mi"
+                        f"Request: CPU {rsrc.requests_cpu_cores:.3f} / Mem {rsrc.requests_mem_mib:.2f}Mi; "
+                        f"Limit: CPU {rsrc.limits_cpu_cores:.3f} / Mem {rsrc.limits_mem_mib:.2f}Mi"
                     )
                     
         return result
+    
+    @staticmethod
+    def has_unknown_containers(pod_metrics, state_data):
+        """
+        Checks whether any container in pod_metrics has no exact entry in state_data
+        """
+        for pod in pod_metrics:
+            metadata = pod.get("metadata", {})
+            namespace = metadata.get("namespace", "unknown")
+            pod_name = metadata.get("name", "unknown")
+            for container in pod.get("containers", []):
+                if (namespace, pod_name, container.get("name", "unknown")) not in state_data:
+                    return True
+        return False
+    
+    @staticmethod
+    def build_pod_index(state_data):
+        """
+        Groups Kube State Metrics pod names by (namespace, container),
+        each list sorted so pods sharing a name prefix can be found with bisect
+        """
+        index = defaultdict(list)
+        for namespace, pod_name, container_name in state_data:
+            index[(namespace, container_name)].append(pod_name)
+        for pod_names in index.values():
+            pod_names.sort()
+        return index
+    
+    @staticmethod
+    def find_by_pod_prefix(pod_index, state_data, namespace, pod_name, container_name, debug_enabled=False):
+        """
+        Finds resources of a pod from the same workload, i.e. whose name shares the longest
+        dash-separated prefix with pod_name (removing replicaset and pod suffixes first).
+        Returns None if there is no such pod. debug_enabled is checked once by the caller
+        """
+        pod_names = pod_index.get((namespace, container_name))
+        if not pod_names:
+            return None
+        
+        # Longest prefix first, so a Deployment pod (<deployment>-<replicaset hash>-<pod hash>)
+        # tries its replicaset name and then its deployment name before anything shorter
+        parts = pod_name.split('-')
+        for i in range(len(parts) - 1, 0, -1):
+            # Create base name starting with 1, 2, ... parts
+            base_name = '-'.join(parts[:i])
+            if debug_enabled:
+                logging.debug(f"Trying to find {namespace}/{base_name}-* for {pod_name}")
+            
+            # Names starting with base_name sort contiguously from its insertion point
+            pos = bisect_left(pod_names, base_name)
+            if pos < len(pod_names) and pod_names[pos].startswith(base_name):
+                key = (namespace, pod_names[pos], container_name)
+                if debug_enabled:
+                    logging.debug(f"Found match {key} for {namespace}/{pod_name}/{container_name}")
+                return state_data[key]
+        
+        return None
 
 
 class KubernetesApiClient(KubernetesClient):
@@ -335,9 +486,13 @@ class KubernetesApiClient(KubernetesClient):
         super().__init__()
         self.api_server_url = os.environ.get('KUBERNETES_API_SERVER', 'https://kubernetes.default.svc')
         
+        # Authenticate every request made through this client's session
+        self.session.headers.update(self.get_auth_headers())
+        
     def patch_pod_resources(self, namespace, pod_name, container_name, memory_request, memory_limit=None):
         """
         Updates pod resources using the Kubernetes API with InPlacePodVerticalScaling
+        and records the scaling time in the pod annotation, in a single PATCH
         """
         if memory_limit is None:
             memory_limit = memory_request
@@ -347,98 +502,46 @@ class KubernetesApiClient(KubernetesClient):
         memory_limit_str = f"{int(memory_limit)}Mi"
         
         url = f"{self.api_server_url}/api/v1/namespaces/{namespace}/pods/{pod_name}"
-        headers = self.get_auth_headers()
-        headers["Content-Type"] = "application/strategic-merge-patch+json"
-        
-        # Prepare the patch payload
-        patch_body = {
-            "spec": {
-                "containers": [
-                    {
-                        "name": container_name,
-                        "resources": {
-                            "requests": {
-                                "memory": memory_request_str
-                            },
-                            "limits": {
-                                "memory": memory_limit_str
-                            }
-                        }
-                    }
-                ]
-            }
-        }
+        
+        timestamp = datetime.utcnow().replace(microsecond=0).isoformat() + 'Z'
+        
+        # The patch schema is fixed, so the body is formatted directly instead of serializing a dict
+        patch_body = _PATCH_BODY_TEMPLATE % (
+            timestamp, json.dumps(container_name), memory_request_str, memory_limit_str
+        )
         
         try:
             logging.info(f"Updating resources for pod {namespace}/{pod_name} container {container_name} to {memory_request_str}")
-            response = requests.patch(
+            response = self.session.patch(
                 url, 
-                json=patch_body,
-                headers=headers,
+                data=patch_body.encode(),
+                headers=_PATCH_HEADERS,
                 verify=self.verify_cert
             )
             response.raise_for_status()
-            
-            # Update annotation with timestamp
-            self.update_last_scale_annotation(namespace, pod_name)
-            
             return True
         except requests.RequestException as e:
             logging.error(f"Failed to update pod resources: {e}")
             if hasattr(e, 'response') and e.response:
                 logging.error(f"Response: {e.response.text}")
+            self._refresh_auth_on_401(e)
             return False
     
-    def update_last_scale_annotation(self, namespace, pod_name):
-        """
-        Updates the pod with an annotation tracking the last scaling time
-        """
-        url = f"{self.api_server_url}/api/v1/namespaces/{namespace}/pods/{pod_name}"
-        headers = self.get_auth_headers()
-        headers["Content-Type"] = "application/strategic-merge-patch+json"
-        
-        timestamp = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
-        
-        patch_body = {
-            "metadata": {
-                "annotations": {
-                    "resource-manager/last-update": timestamp
-                }
-            }
-        }
-        
-        try:
-            response = requests.patch(
-                url, 
-                json=patch_body,
-                headers=headers,
-                verify=self.verify_cert
-            )
-            response.raise_for_status()
-            return True
-        except requests.RequestException as e:
-            logging.error(f"Failed to update pod annotation: {e}")
-            return False
-            
     def get_pod_annotations(self, namespace, pod_name):
         """
-        Gets pod annotations
+        Gets pod annotations. Returns None if the pod could not be fetched
         """
         url = f"{self.api_server_url}/api/v1/namespaces/{namespace}/pods/{pod_name}"
-        headers = self.get_auth_headers()
         
         try:
-            response = requests.get(
-                url,
-                headers=headers,
-                verify=self.verify_cert
-            )
+            response = self.session.get(url, verify=self.verify_cert)
             response.raise_for_status()
             pod_data = response.json()
             return pod_data.get("metadata", {}).get("annotations", {})
         except requests.RequestException as e:
             logging.error(f"Failed to get pod annotations: {e}")
-            return {}
+            self._refresh_auth_on_401(e)
+            return None
 
 
 class ResourceManager:
@@ -466,6 +569,20 @@ class ResourceManager:
         
         self.metrics_fetch_interval = int(os.environ.get('METRICS_FETCH_INTERVAL', '30'))
         
+        # Pods are evaluated in parallel so their API round trips overlap
+        # (the clients' HTTP pools are sized to match)
+        self.scale_workers = _scale_workers()
+        self._pool = ThreadPoolExecutor(max_workers=self.scale_workers)
+        
+        # Last scaling time per (namespace, pod), updated on our own successful patches so
+        # the scale-down cooldown check doesn't GET every pod every cycle. Pods not in the
+        # cache (e.g. after a restart) are looked up once via their annotation. LRU-bounded
+        self._last_scale = OrderedDict()
+        self._last_scale_max_entries = 4096
+        self._last_scale_lock = threading.Lock()
+        
+        self._debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+        
         # Log configuration
         self._log_configuration()
         
@@ -478,6 +595,7 @@ class ResourceManager:
             logging.info(f"- Min memory request: {self.min_request_memory}Mi")
             logging.info(f"- Cooldown period: {self.cooldown_period_seconds} seconds")
             logging.info(f"- Metrics fetch interval: {self.metrics_fetch_interval} seconds")
+            logging.info(f"- Scale workers: {self.scale_workers}")
 
     def run(self):
         """
@@ -497,6 +615,9 @@ class ResourceManager:
         """
         Process resources for all pods matching the label selector
         """
+        # Checked once per cycle; also used by the per-pod scaling methods
+        self._debug_enabled = logging.getLogger().isEnabledFor(logging.DEBUG)
+        
         # 1. Get resource data from Kube State Metrics
         state_data = self.kube_state_client.fetch_metrics()
         
@@ -508,38 +629,115 @@ class ResourceManager:
         # 3. Parse pod metrics
         pods_metrics = metrics_data.get("items", [])
         if not pods_metrics:
-            if logging.getLogger().isEnabledFor(logging.DEBUG):
+            if self._debug_enabled:
                 logging.debug("No pod metrics found")
             return
             
+        # A cached scrape lacks pods created since it was taken, and the prefix fallback
+        # would give those a sibling's (possibly older ReplicaSet's) requests: rescrape once
+        if self.kube_state_client.from_cache and self.metrics_client.has_unknown_containers(pods_metrics, state_data):
+            if self._debug_enabled:
+                logging.debug("Containers missing from cached Kube State Metrics data; refetching")
+            self.kube_state_client.invalidate()
+            state_data = self.kube_state_client.fetch_metrics()
+        
         # 4. Parse and process pod metrics
         parsed_metrics = self.metrics_client.parse_pod_metrics(pods_metrics, state_data)
         
-        # 5. For each pod/container, determine if scaling is needed
-        for (namespace, pod_name, container_name), metrics in parsed_metrics.items():
+        # 5. Most containers sit between the thresholds and need nothing; drop them
+        # (and those without a memory request) before dispatching any work
+        scaling_direction = self._scaling_direction
+        candidates = [
+            (key, metrics) for key, metrics in parsed_metrics.items()
+            if scaling_direction(metrics)
+        ]
+        if not candidates:
+            return
+        
+        # 6. Scale pods in parallel, but the containers of a pod one after another:
+        # the cooldown is per pod, so a patch of one container must hold back the others
+        pods = defaultdict(list)
+        for (namespace, pod_name, container_name), metrics in candidates:
+            pods[(namespace, pod_name)].append((container_name, metrics))
+        
+        # Consuming the results re-raises the first error into the main loop
+        list(self._pool.map(
+            lambda item: self._process_pod(*item[0], item[1]),
+            pods.items()
+        ))
+    
+    def _process_pod(self, namespace, pod_name, containers):
+        """
+        Evaluates and scales the given (container_name, metrics) of a pod in sequence
+        """
+        for container_name, metrics in containers:
             self._evaluate_and_scale(namespace, pod_name, container_name, metrics)
     
-    def _evaluate_and_scale(self, namespace, pod_name, container_name, metrics):
+    def _scaling_direction(self, metrics):
         """
-        Evaluates if a container needs scaling and performs the scaling if needed
+        Returns _SCALE_UP or _SCALE_DOWN if the container's memory usage ratio
+        crosses a threshold, otherwise _NO_SCALE
         """
-        memory_usage = metrics['memory_usage']
-        memory_request = metrics['requests_mem_mib']
+        memory_request = metrics.requests_mem_mib
         
         # Skip if there's no memory request set (can't determine ratios)
         if memory_request <= 0:
-            return
-            
-        # Calculate usage ratio
-        usage_ratio = memory_usage / memory_request
+            return _NO_SCALE
         
-        # Check if we need to scale up
+        usage_ratio = metrics.memory_usage / memory_request
         if usage_ratio >= self.scale_up_threshold:
-            self._scale_up(namespace, pod_name, container_name, memory_usage, memory_request)
+            return _SCALE_UP
+        if usage_ratio <= self.scale_down_threshold:
+            return _SCALE_DOWN
+        return _NO_SCALE
+    
+    def _evaluate_and_scale(self, namespace, pod_name, container_name, metrics):
+        """
+        Evaluates if a container needs scaling and performs the scaling if needed
+        """
+        direction = self._scaling_direction(metrics)
+        if direction == _SCALE_UP:
+            self._scale_up(namespace, pod_name, container_name, metrics.memory_usage, metrics.requests_mem_mib)
+        elif direction == _SCALE_DOWN:
+            self._scale_down(namespace, pod_name, container_name, metrics.memory_usage, metrics.requests_mem_mib)
+    
+    def _get_last_scale(self, namespace, pod_name):
+        """
+        Returns the last scaling time of a pod, or None if it was never scaled.
+        Reads the pod annotation only when the pod is not cached yet
+        """
+        key = (namespace, pod_name)
+        with self._last_scale_lock:
+            if key in self._last_scale:
+                self._last_scale.move_to_end(key)
+                return self._last_scale[key]
+        
+        annotations = self.k8s_client.get_pod_annotations(namespace, pod_name)
+        if annotations is None:
+            # Don't cache a failed lookup as "never scaled"
+            return None
+        
+        last_update_time = None
+        last_update = annotations.get("resource-manager/last-update")
+        if last_update:
+            try:
+                last_update_time = _parse_timestamp(last_update)
+            except ValueError:
+                logging.warning(f"Invalid timestamp format in pod annotation: {last_update}")
         
-        # Check if we need to scale down
-        elif usage_ratio <= self.scale_down_threshold:
-            self._scale_down(namespace, pod_name, container_name, memory_usage, memory_request)
+        self._remember_last_scale(namespace, pod_name, last_update_time)
+        return last_update_time
+    
+    def _remember_last_scale(self, namespace, pod_name, last_update_time):
+        """
+        Caches the last scaling time of a pod, evicting the least recently used entry when full
+        """
+        key = (namespace, pod_name)
+        with self._last_scale_lock:
+            self._last_scale[key] = last_update_time
+            self._last_scale.move_to_end(key)
+            if len(self._last_scale) > self._last_scale_max_entries:
+                self._last_scale.popitem(last=False)
     
     def _scale_up(self, namespace, pod_name, container_name, memory_usage, current_request):
         """
@@ -561,37 +759,32 @@ class ResourceManager:
         )
         
         # Update the resources
-        self.k8s_client.patch_pod_resources(
+        if self.k8s_client.patch_pod_resources(
             namespace=namespace,
             pod_name=pod_name,
             container_name=container_name,
             memory_request=new_memory_request
-        )
+        ):
+            self._remember_last_scale(namespace, pod_name, datetime.utcnow())
+            self.kube_state_client.invalidate()
     
     def _scale_down(self, namespace, pod_name, container_name, memory_usage, current_request):
         """
         Scales down container resources if usage has been low for sufficient time
         """
-        # Get pod annotations to check cooldown period
-        annotations = self.k8s_client.get_pod_annotations(namespace, pod_name)
-        last_update = annotations.get("resource-manager/last-update")
-        
-        # If we have a last update timestamp, check cooldown period
-        if last_update:
-            try:
-                last_update_time = datetime.strptime(last_update, "%Y-%m-%dT%H:%M:%SZ")
-                cooldown_end_time = last_update_time + timedelta(seconds=self.cooldown_period_seconds)
-                
-                if datetime.utcnow() < cooldown_end_time:
-                    if logging.getLogger().isEnabledFor(logging.DEBUG):
-                        remaining = cooldown_end_time - datetime.utcnow()
-                        logging.debug(
-                            f"Pod {namespace}/{pod_name} container {container_name} in cooldown period. "
-                            f"{remaining.total_seconds():.0f} seconds remaining."
-                        )
-                    return
-            except ValueError:
-                logging.warning(f"Invalid timestamp format in pod annotation: {last_update}")
+        # If we have a last update time, check cooldown period
+        last_update_time = self._get_last_scale(namespace, pod_name)
+        if last_update_time:
+            cooldown_end_time = last_update_time + timedelta(seconds=self.cooldown_period_seconds)
+            
+            if datetime.utcnow() < cooldown_end_time:
+                if self._debug_enabled:
+                    remaining = cooldown_end_time - datetime.utcnow()
+                    logging.debug(
+                        f"Pod {namespace}/{pod_name} container {container_name} in cooldown period. "
+                        f"{remaining.total_seconds():.0f} seconds remaining."
+                    )
+                return
         
         # Calculate new memory request based on current usage
         new_memory_request = max(
@@ -613,14 +806,16 @@ class ResourceManager:
             )
             
             # Update the resources
-            self.k8s_client.patch_pod_resources(
+            if self.k8s_client.patch_pod_resources(
                 namespace=namespace,
                 pod_name=pod_name,
                 container_name=container_name,
                 memory_request=new_memory_request
-            )
+            ):
+                self._remember_last_scale(namespace, pod_name, datetime.utcnow())
+                self.kube_state_client.invalidate()
         else:
-            if logging.getLogger().isEnabledFor(logging.DEBUG):
+            if self._debug_enabled:
                 logging.debug(
                     f"Pod {namespace}/{pod_name} container {container_name} - change too small "
                     f"({change_percentage:.1%}) to scale down"